@@ -55,15 +55,20 @@ class Emitter:
         self.env = env or Environment()
         self.fragments = []  # type: List[str]
         self._indent = 0
+        # Cached prefix for the current indent level; emit_line runs
+        # once per generated line, so don't rebuild it every time.
+        self._indent_str = ''
 
     # Low-level operations
 
     def indent(self) -> None:
         self._indent += 4
+        self._indent_str = self._indent * ' '
 
     def dedent(self) -> None:
         self._indent -= 4
         assert self._indent >= 0
+        self._indent_str = self._indent * ' '
 
     def label(self, label: BasicBlock) -> str:
         return 'CPyL%s' % label.label
@@ -77,7 +82,7 @@ class Emitter:
     def emit_line(self, line: str = '') -> None:
         if line.startswith('}'):
             self.dedent()
-        self.fragments.append(self._indent * ' ' + line + '\n')
+        self.fragments.append(self._indent_str + line + '\n')
         if line.endswith('{'):
             self.indent()
 
@@ -85,6 +90,18 @@ class Emitter:
         for line in lines:
             self.emit_line(line)
 
+    def emit_raw(self, lines: List[str]) -> None:
+        """Add a batch of lines at the current indent level.
+
+        Unlike emit_line(), this doesn't look for braces in the lines,
+        so it must only be used for lines that don't open or close a
+        C block.
+        """
+        indent = self._indent_str
+        # Join the block into a single fragment: one list append per
+        # block instead of one per line.
+        self.fragments.append(''.join(indent + line + '\n' for line in lines))
+
     def emit_label(self, label: Union[BasicBlock, str]) -> None:
         if isinstance(label, str):
             text = label
@@ -149,7 +166,7 @@ class Emitter:
         return self.c_undefined_value(rtype)
 
     def native_function_name(self, fn: FuncDecl) -> str:
-        return '{}{}'.format(NATIVE_PREFIX, fn.cname(self.names))
+        return fn.native_name(self.names)
 
     def tuple_c_declaration(self, rtuple: RTuple) -> List[str]:
         result = ['struct {} {{'.format(rtuple.struct_name)]
@@ -184,8 +201,7 @@ class Emitter:
 
     def tuple_undefined_value(self, rtuple: RTuple) -> str:
         context = self.context
-        id = rtuple.unique_id
-        name = 'tuple_undefined_' + id
+        name = rtuple.undefined_name
         if name not in context.declarations:
             values = self.tuple_undefined_value_helper(rtuple)
             var = 'struct {} {}'.format(rtuple.struct_name, name)
@@ -481,7 +497,7 @@ class Emitter:
 
     def emit_unbox(self, src: str, dest: str, typ: RType, custom_failure: Optional[str] = None,
                    declare_dest: bool = False, borrow: bool = False,
-                   optional: bool = False) -> None:
+                   optional: bool = False, raise_exception: bool = True) -> None:
         """Emit code for unboxing a value of given type (from PyObject *).
 
         Evaluate C code in 'failure' if the value has an incompatible type.
@@ -495,12 +511,17 @@ class Emitter:
             failure: What happens on error
             declare_dest: If True, also declare the variable 'dest'
             borrow: If True, create a borrowed reference
+            raise_exception: If False, 'custom_failure' is responsible
+                for raising the type error itself
         """
         # TODO: Verify refcount handling.
         raise_exc = 'CPy_TypeError("{}", {});'.format(self.pretty_name(typ), src)
         if custom_failure is not None:
-            failure = [raise_exc,
-                       custom_failure]
+            if raise_exception:
+                failure = [raise_exc,
+                           custom_failure]
+            else:
+                failure = [custom_failure]
         else:
             failure = [raise_exc,
                        '%s = %s;' % (dest, self.c_error_value(typ))]
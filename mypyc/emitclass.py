@@ -1,8 +1,7 @@
 """Code generation for native classes and related wrappers."""
 
 
-from typing import Optional, List, Tuple, Dict, Callable, Mapping, Set
-from collections import OrderedDict
+from typing import Optional, List, Tuple, Dict, Callable
 
 from mypyc.common import NATIVE_PREFIX, PREFIX, REG_PREFIX
 from mypyc.emit import Emitter
@@ -21,22 +20,46 @@ from mypyc.namegen import NameGenerator
 
 
 def native_slot(cl: ClassIR, fn: FuncIR, emitter: Emitter) -> str:
-    return '{}{}'.format(NATIVE_PREFIX, fn.cname(emitter.names))
+    return fn.native_name(emitter.names)
 
 
 def wrapper_slot(cl: ClassIR, fn: FuncIR, emitter: Emitter) -> str:
-    return '{}{}'.format(PREFIX, fn.cname(emitter.names))
+    return PREFIX + fn.cname(emitter.names)
+
+
+def generate_init_for_class(cl: ClassIR,
+                            init_fn: FuncIR,
+                            emitter: Emitter) -> str:
+    """Generate an init function suitable for use as tp_init.
+
+    tp_init needs to be a function that returns an int, and our
+    __init__ methods return a PyObject. Translate NULL to -1,
+    everything else to 0.
+    """
+    func_name = '%s_init' % cl.name_prefix(emitter.names)
+
+    emitter.emit_line('static int')
+    emitter.emit_line(
+        '%s(PyObject *self, PyObject *args, PyObject *kwds)' % func_name)
+    emitter.emit_line('{')
+    emitter.emit_line('return %s%s(self, args, kwds) != NULL ? 0 : -1;' % (
+        PREFIX, init_fn.cname(emitter.names)))
+    emitter.emit_line('}')
+
+    return func_name
 
 
 # We maintain a table from dunder function names to struct slots they
 # correspond to and functions that generate a wrapper (if necessary)
 # and return the function name to stick in the slot.
 # TODO: Add remaining dunder methods
+# (Use a concrete Dict for the tables so that compiled code can use the
+# fast dict primitives when iterating them.)
 SlotGenerator = Callable[[ClassIR, FuncIR, Emitter], str]
-SlotTable = Mapping[str, Tuple[str, SlotGenerator]]
+SlotTable = Dict[str, Tuple[str, SlotGenerator]]
 
 SLOT_DEFS = {
-    '__init__': ('tp_init', lambda c, t, e: generate_init_for_class(c, t, e)),
+    '__init__': ('tp_init', generate_init_for_class),
     '__call__': ('tp_call', wrapper_slot),
     '__str__': ('tp_str', native_slot),
     '__repr__': ('tp_repr', native_slot),
@@ -64,13 +87,73 @@ SIDE_TABLES = [
     ('as_mapping', 'PyMappingMethods', AS_MAPPING_SLOT_DEFS),
     ('as_number', 'PyNumberMethods', AS_NUMBER_SLOT_DEFS),
     ('as_async', 'PyAsyncMethods', AS_ASYNC_SLOT_DEFS),
-]
+]  # type: List[Tuple[str, str, SlotTable]]
+
+# All dunders that end up in a type object slot, in any of the tables.
+ALL_SLOT_NAMES = frozenset(SLOT_DEFS) | {
+    name for _, _, defs in SIDE_TABLES for name in defs}
+
+# The methods generate_class resolves by name: the slot dunders plus a
+# couple of specials that are looked up directly.
+CLASS_METHOD_NAMES = ALL_SLOT_NAMES | frozenset(['__mypyc_defaults_setup'])
+
+# Emission order for the class-specific template slots, so the output
+# is deterministic no matter how the fields dict gets populated.
+PYTYPE_FIELD_ORDER = (
+    'tp_new', 'tp_dealloc', 'tp_traverse', 'tp_clear', 'tp_getset',
+    'tp_methods', 'tp_init', 'tp_call', 'tp_str', 'tp_repr',
+    'tp_iternext', 'tp_iter', 'tp_hash', 'tp_descr_get',
+    'tp_as_mapping', 'tp_as_number', 'tp_as_async', 'tp_richcompare',
+    'tp_members', 'tp_basicsize', 'tp_dictoffset', 'tp_weaklistoffset',
+)
 
 
-def generate_slots(cl: ClassIR, table: SlotTable, emitter: Emitter) -> Dict[str, str]:
-    fields = OrderedDict()  # type: Dict[str, str]
+def emit_type_template(fields: Dict[str, str],
+                       type_struct: str,
+                       pyname: str,
+                       flags: str,
+                       emitter: Emitter) -> None:
+    """Emit the PyTypeObject template for a class.
+
+    The shared skeleton lives in the CPy_TYPE_TEMPLATE_HEAD/END runtime
+    macros; only the class-specific slots are written out, in the fixed
+    PYTYPE_FIELD_ORDER.
+    """
+    lines = []  # type: List[str]
+    for field in PYTYPE_FIELD_ORDER:
+        value = fields.pop(field, None)
+        if value is not None:
+            lines.append('.%s = %s,' % (field, value))
+    # Anything not covered by the static order (shouldn't normally
+    # happen) still gets emitted, after the known slots.
+    for field, value in fields.items():
+        lines.append('.%s = %s,' % (field, value))
+    emitter.emit_line('CPy_TYPE_TEMPLATE_HEAD(%s, "%s", %s)' % (type_struct, pyname, flags))
+    emitter.emit_raw(lines)
+    emitter.emit_line('CPy_TYPE_TEMPLATE_END(%s)' % type_struct)
+
+
+def find_slot_methods(cl: ClassIR) -> Dict[str, FuncIR]:
+    """Resolve the implementation of every special method a class has.
+
+    A single pass over the MRO replaces a separate get_method() MRO
+    walk per candidate name; most of them are absent for most classes.
+    """
+    found = {}  # type: Dict[str, FuncIR]
+    for ir in cl.mro:
+        for name, method in ir.methods.items():
+            if name in CLASS_METHOD_NAMES and name not in found:
+                found[name] = method
+    return found
+
+
+def generate_slots(cl: ClassIR, table: SlotTable, found: Dict[str, FuncIR],
+                   emitter: Emitter) -> Dict[str, str]:
+    # Iterate the table (rather than found) so that wrappers are
+    # generated in a stable order.
+    fields = {}  # type: Dict[str, str]
     for name, (slot, generator) in table.items():
-        method = cl.get_method(name)
+        method = found.get(name)
         if method:
             fields[slot] = generator(cl, method, emitter)
 
@@ -78,15 +161,16 @@ def generate_slots(cl: ClassIR, table: SlotTable, emitter: Emitter) -> Dict[str,
 
 
 def generate_class_type_decl(cl: ClassIR, c_emitter: Emitter, emitter: Emitter) -> None:
-    c_emitter.emit_line('PyTypeObject *{};'.format(emitter.type_struct_name(cl)))
-    emitter.emit_line('extern PyTypeObject *{};'.format(emitter.type_struct_name(cl)))
+    type_struct = emitter.type_struct_name(cl)
+    c_emitter.emit_line('PyTypeObject *%s;' % type_struct)
+    emitter.emit_line('extern PyTypeObject *%s;' % type_struct)
     emitter.emit_line()
     generate_object_struct(cl, emitter)
     emitter.emit_line()
     declare_native_getters_and_setters(cl, emitter)
     generate_full = not cl.is_trait and not cl.builtin_base
     if generate_full:
-        emitter.emit_line('{};'.format(native_function_header(cl.ctor, emitter)))
+        emitter.emit_line('%s;' % native_function_header(cl.ctor, emitter))
 
 
 def generate_class(cl: ClassIR, module: str, emitter: Emitter) -> None:
@@ -94,109 +178,150 @@ def generate_class(cl: ClassIR, module: str, emitter: Emitter) -> None:
 
     This is the main entry point to the module.
     """
+    if cl.is_trait:
+        generate_trait_class(cl, emitter)
+        return
+
     name = cl.name
     name_prefix = cl.name_prefix(emitter.names)
+    struct_name = cl.struct_name(emitter.names)
+    type_struct = emitter.type_struct_name(cl)
+
+    setup_name = '%s_setup' % name_prefix
+    new_name = '%s_new' % name_prefix
+    members_name = '%s_members' % name_prefix
+    getseters_name = '%s_getseters' % name_prefix
+    vtable_name = '%s_vtable' % name_prefix
+    traverse_name = '%s_traverse' % name_prefix
+    clear_name = '%s_clear' % name_prefix
+    dealloc_name = '%s_dealloc' % name_prefix
+    methods_name = '%s_methods' % name_prefix
+    vtable_setup_name = '%s_trait_vtable_setup' % name_prefix
+
+    fields = {}  # type: Dict[str, str]
+
+    # The traverse, clear and setup functions all walk the same
+    # attributes, so flatten the MRO walk once instead of redoing it
+    # (and the emitter.attr() calls) in each of them. Using the
+    # deduplicated list also avoids emitting redundant visit/clear/init
+    # lines when an attribute is redeclared with the same type in a
+    # subclass: the object struct only has one field for it.
+    attrs = [(emitter.attr(attr), rtype) for attr, rtype in cl.unique_attributes()]
+    if cl.has_dict and not cl.builtin_base:
+        # __dict__ and __weakref__ are regular fields of the object
+        # struct (generate_object_struct adds them), so they can be
+        # referenced by name.
+        dict_exprs = ('self->__dict__', 'self->__weakref__')  # type: Optional[Tuple[str, str]]
+    else:
+        dict_exprs = None
 
-    setup_name = '{}_setup'.format(name_prefix)
-    new_name = '{}_new'.format(name_prefix)
-    members_name = '{}_members'.format(name_prefix)
-    getseters_name = '{}_getseters'.format(name_prefix)
-    vtable_name = '{}_vtable'.format(name_prefix)
-    traverse_name = '{}_traverse'.format(name_prefix)
-    clear_name = '{}_clear'.format(name_prefix)
-    dealloc_name = '{}_dealloc'.format(name_prefix)
-    methods_name = '{}_methods'.format(name_prefix)
-    vtable_setup_name = '{}_trait_vtable_setup'.format(name_prefix)
-
-    fields = OrderedDict()  # type: Dict[str, str]
-    fields['tp_name'] = '"{}"'.format(name)
-
-    generate_full = not cl.is_trait and not cl.builtin_base
+    generate_full = not cl.builtin_base
     needs_getseters = not cl.is_generated
 
     if generate_full:
         fields['tp_new'] = new_name
-        fields['tp_dealloc'] = '(destructor){}_dealloc'.format(name_prefix)
-        fields['tp_traverse'] = '(traverseproc){}_traverse'.format(name_prefix)
-        fields['tp_clear'] = '(inquiry){}_clear'.format(name_prefix)
+        fields['tp_dealloc'] = '(destructor)%s_dealloc' % name_prefix
+        fields['tp_traverse'] = '(traverseproc)%s_traverse' % name_prefix
+        fields['tp_clear'] = '(inquiry)%s_clear' % name_prefix
     if needs_getseters:
         fields['tp_getset'] = getseters_name
     fields['tp_methods'] = methods_name
 
-    def emit_line() -> None:
-        emitter.emit_line()
+    # Bind the bound method once; generate_class emits a lot of lines.
+    emit_line = emitter.emit_line
 
     emit_line()
 
+    # Resolve all the special methods we may need with one MRO pass.
+    slot_methods = find_slot_methods(cl)
+
     # If the class has a method to initialize default attribute
     # values, we need to call it during initialization.
-    defaults_fn = cl.get_method('__mypyc_defaults_setup')
+    defaults_fn = slot_methods.get('__mypyc_defaults_setup')
 
     # If there is a __init__ method, we'll use it in the native constructor.
-    init_fn = cl.get_method('__init__')
+    init_fn = slot_methods.get('__init__')
 
     # Fill out slots in the type object from dunder methods.
-    fields.update(generate_slots(cl, SLOT_DEFS, emitter))
+    fields.update(generate_slots(cl, SLOT_DEFS, slot_methods, emitter))
 
     # Fill out dunder methods that live in tables hanging off the side.
-    for table_name, type, slot_defs in SIDE_TABLES:
-        slots = generate_slots(cl, slot_defs, emitter)
+    for table_name, table_type, slot_defs in SIDE_TABLES:
+        slots = generate_slots(cl, slot_defs, slot_methods, emitter)
         if slots:
-            table_struct_name = generate_side_table_for_class(cl, table_name, type, slots, emitter)
-            fields['tp_{}'.format(table_name)] = '&{}'.format(table_struct_name)
+            table_struct_name = generate_side_table_for_class(cl, table_name, table_type,
+                                                              slots, emitter)
+            fields['tp_%s' % table_name] = '&%s' % table_struct_name
 
     richcompare_name = generate_richcompare_wrapper(cl, emitter)
     if richcompare_name:
         fields['tp_richcompare'] = richcompare_name
 
     # If the class inherits from python, make space for a __dict__
-    struct_name = cl.struct_name(emitter.names)
     if cl.builtin_base:
-        base_size = 'sizeof({})'.format(cl.builtin_base)
-    elif cl.is_trait:
-        base_size = 'sizeof(PyObject)'
+        base_size = 'sizeof(%s)' % cl.builtin_base
     else:
-        base_size = 'sizeof({})'.format(struct_name)
+        base_size = 'sizeof(%s)' % struct_name
     # Since our types aren't allocated using type() we need to
     # populate these fields ourselves if we want them to have correct
     # values. PyType_Ready will inherit the offsets from tp_base but
     # that isn't what we want.
 
+    # Plain 'object' attributes need no coercion and no custom
+    # undefined check, so CPython's member descriptors can read and
+    # write the struct field directly (no generated getter/setter).
+    members = ['{"%s", T_OBJECT_EX, offsetof(%s, %s), 0, NULL},' %
+               (attr, struct_name, emitter.attr(attr))
+               for attr, rtype in cl.attributes.items()
+               if attr_uses_member_descriptor(cl, rtype)]
+
     # XXX: there is no reason for the __weakref__ stuff to be mixed up with __dict__
     if cl.has_dict:
-        # __dict__ lives right after the struct and __weakref__ lives right after that
-        # TODO: They should get members in the struct instead of doing this nonsense.
-        weak_offset = '{} + sizeof(PyObject *)'.format(base_size)
-        emitter.emit_lines(
-            'PyMemberDef {}[] = {{'.format(members_name),
-            '{{"__dict__", T_OBJECT_EX, {}, 0, NULL}},'.format(base_size),
-            '{{"__weakref__", T_OBJECT_EX, {}, 0, NULL}},'.format(weak_offset),
-            '{0}',
-            '};',
-        )
-
-        fields['tp_members'] = members_name
-        fields['tp_basicsize'] = '{} + 2*sizeof(PyObject *)'.format(base_size)
-        fields['tp_dictoffset'] = base_size
+        if cl.builtin_base:
+            # We can't add fields to the builtin base's struct, so
+            # __dict__ lives right after it and __weakref__ right
+            # after that.
+            dict_offset = base_size
+            weak_offset = '%s + sizeof(PyObject *)' % base_size
+            fields['tp_basicsize'] = '%s + 2*sizeof(PyObject *)' % base_size
+        else:
+            # __dict__ and __weakref__ are fields of the object struct.
+            dict_offset = 'offsetof(%s, __dict__)' % struct_name
+            weak_offset = 'offsetof(%s, __weakref__)' % struct_name
+            fields['tp_basicsize'] = base_size
+        members.append('{"__dict__", T_OBJECT_EX, %s, 0, NULL},' % dict_offset)
+        members.append('{"__weakref__", T_OBJECT_EX, %s, 0, NULL},' % weak_offset)
+
+        fields['tp_dictoffset'] = dict_offset
         fields['tp_weaklistoffset'] = weak_offset
     else:
         fields['tp_basicsize'] = base_size
 
+    if members:
+        members.append('{0}')
+        emit_line('PyMemberDef %s[] = {' % members_name)
+        emitter.emit_raw(members)
+        emit_line('};')
+
+        fields['tp_members'] = members_name
+
     if generate_full:
-        emitter.emit_line('static PyObject *{}(void);'.format(setup_name))
+        emit_line('static PyObject *%s(void);' % setup_name)
         assert cl.ctor is not None
-        emitter.emit_line(native_function_header(cl.ctor, emitter) + ';')
+        # The header is also needed for the constructor definition below.
+        ctor_header = native_function_header(cl.ctor, emitter)
+        emit_line(ctor_header + ';')
 
         emit_line()
-        generate_new_for_class(cl, new_name, vtable_name, setup_name, emitter)
+        generate_new_for_class(cl, new_name, type_struct, setup_name, emitter)
         emit_line()
-        generate_traverse_for_class(cl, traverse_name, emitter)
+        generate_traverse_for_class(traverse_name, struct_name, attrs, dict_exprs, emitter)
         emit_line()
-        generate_clear_for_class(cl, clear_name, emitter)
+        generate_clear_for_class(clear_name, struct_name, attrs, dict_exprs, emitter)
         emit_line()
-        generate_dealloc_for_class(cl, dealloc_name, clear_name, emitter)
+        generate_dealloc_for_class(cl, dealloc_name, clear_name, struct_name, emitter)
         emit_line()
-        generate_native_getters_and_setters(cl, emitter)
+        generate_native_getters_and_setters(cl, struct_name, emitter)
         vtable_name = generate_vtables(cl, vtable_name, emitter)
         emit_line()
     if needs_getseters:
@@ -210,99 +335,198 @@ def generate_class(cl: ClassIR, module: str, emitter: Emitter) -> None:
     flags = ['Py_TPFLAGS_DEFAULT', 'Py_TPFLAGS_HEAPTYPE', 'Py_TPFLAGS_BASETYPE']
     if generate_full:
         flags.append('Py_TPFLAGS_HAVE_GC')
-    fields['tp_flags'] = ' | '.join(flags)
 
-    emitter.emit_line("static PyTypeObject {}_template_ = {{".format(emitter.type_struct_name(cl)))
-    emitter.emit_line("PyVarObject_HEAD_INIT(NULL, 0)")
-    for field, value in fields.items():
-        emitter.emit_line(".{} = {},".format(field, value))
-    emitter.emit_line("};")
-    emitter.emit_line("static PyTypeObject *{t}_template = &{t}_template_;".format(
-        t=emitter.type_struct_name(cl)))
+    emit_type_template(fields, type_struct, name, ' | '.join(flags), emitter)
 
-    emitter.emit_line()
+    emit_line()
     generate_trait_vtable_setup(cl, vtable_setup_name, vtable_name, emitter)
     if generate_full:
-        generate_setup_for_class(cl, setup_name, defaults_fn, vtable_name, emitter)
-        emitter.emit_line()
+        generate_setup_for_class(setup_name, defaults_fn, vtable_name,
+                                 struct_name, type_struct, attrs, emitter)
+        emit_line()
         generate_constructor_for_class(
-            cl, cl.ctor, init_fn, setup_name, vtable_name, emitter)
-        emitter.emit_line()
+            cl.ctor, ctor_header, init_fn, setup_name, emitter)
+        emit_line()
+    if needs_getseters:
+        generate_getseters(cl, emitter)
+
+
+def generate_trait_class(cl: ClassIR, emitter: Emitter) -> None:
+    """Generate C code for a trait.
+
+    Traits don't get an instance struct of their own, so the allocation,
+    GC, native getter/setter and vtable machinery is all skipped: only
+    the type object template, dunder wrappers, methods table and
+    getseters are emitted.
+    """
+    name_prefix = cl.name_prefix(emitter.names)
+    type_struct = emitter.type_struct_name(cl)
+
+    members_name = '%s_members' % name_prefix
+    getseters_name = '%s_getseters' % name_prefix
+    methods_name = '%s_methods' % name_prefix
+    vtable_setup_name = '%s_trait_vtable_setup' % name_prefix
+
+    fields = {}  # type: Dict[str, str]
+
+    needs_getseters = not cl.is_generated
+    if needs_getseters:
+        fields['tp_getset'] = getseters_name
+    fields['tp_methods'] = methods_name
+
+    emit_line = emitter.emit_line
+    emit_line()
+
+    slot_methods = find_slot_methods(cl)
+
+    # Fill out slots in the type object from dunder methods.
+    fields.update(generate_slots(cl, SLOT_DEFS, slot_methods, emitter))
+
+    # Fill out dunder methods that live in tables hanging off the side.
+    for table_name, table_type, slot_defs in SIDE_TABLES:
+        slots = generate_slots(cl, slot_defs, slot_methods, emitter)
+        if slots:
+            table_struct_name = generate_side_table_for_class(cl, table_name, table_type,
+                                                              slots, emitter)
+            fields['tp_%s' % table_name] = '&%s' % table_struct_name
+
+    richcompare_name = generate_richcompare_wrapper(cl, emitter)
+    if richcompare_name:
+        fields['tp_richcompare'] = richcompare_name
+
+    base_size = 'sizeof(PyObject)'
+    if cl.has_dict:
+        # __dict__ lives right after the struct and __weakref__ lives right after that
+        weak_offset = '%s + sizeof(PyObject *)' % base_size
+        emit_line('PyMemberDef %s[] = {' % members_name)
+        emitter.emit_raw([
+            '{"__dict__", T_OBJECT_EX, %s, 0, NULL},' % base_size,
+            '{"__weakref__", T_OBJECT_EX, %s, 0, NULL},' % weak_offset,
+            '{0}',
+        ])
+        emit_line('};')
+
+        fields['tp_members'] = members_name
+        fields['tp_basicsize'] = '%s + 2*sizeof(PyObject *)' % base_size
+        fields['tp_dictoffset'] = base_size
+        fields['tp_weaklistoffset'] = weak_offset
+    else:
+        fields['tp_basicsize'] = base_size
+
+    if needs_getseters:
+        generate_getseter_declarations(cl, emitter)
+        emit_line()
+        generate_getseters_table(cl, getseters_name, emitter)
+        emit_line()
+    generate_methods_table(cl, methods_name, emitter)
+    emit_line()
+
+    emit_type_template(fields, type_struct, cl.name,
+                       'Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HEAPTYPE | Py_TPFLAGS_BASETYPE',
+                       emitter)
+
+    emit_line()
+    generate_trait_vtable_setup(cl, vtable_setup_name, '%s_vtable' % name_prefix, emitter)
     if needs_getseters:
         generate_getseters(cl, emitter)
 
 
 def getter_name(cl: ClassIR, attribute: str, names: NameGenerator) -> str:
-    return names.private_name(cl.module_name, '{}_get{}'.format(cl.name, attribute))
+    return names.private_name(cl.module_name, '%s_get%s' % (cl.name, attribute))
 
 
 def setter_name(cl: ClassIR, attribute: str, names: NameGenerator) -> str:
-    return names.private_name(cl.module_name, '{}_set{}'.format(cl.name, attribute))
+    return names.private_name(cl.module_name, '%s_set%s' % (cl.name, attribute))
+
+
+def attr_uses_member_descriptor(cl: ClassIR, rtype: RType) -> bool:
+    """Is an attribute exposed through tp_members instead of a getset?
+
+    Only plain 'object' attributes qualify: anything else needs a
+    coercion or an undefined value that CPython's member descriptors
+    don't know about. Classes with a builtin base don't use the
+    generated struct for their instance layout, so their attributes
+    stay on the getset path.
+    """
+    return (not cl.builtin_base and not cl.is_generated
+            and is_same_type(rtype, object_rprimitive))
 
 
 def generate_object_struct(cl: ClassIR, emitter: Emitter) -> None:
     emitter.emit_lines('typedef struct {',
                        'PyObject_HEAD',
                        'CPyVTableItem *vtable;')
-    seen_attrs = set()  # type: Set[Tuple[str, RType]]
-    for base in reversed(cl.base_mro):
-        if not base.is_trait:
-            for attr, rtype in base.attributes.items():
-                if (attr, rtype) not in seen_attrs:
-                    emitter.emit_line('{}{};'.format(emitter.ctype_spaced(rtype),
-                                                     emitter.attr(attr)))
-                    seen_attrs.add((attr, rtype))
-    emitter.emit_line('}} {};'.format(cl.struct_name(emitter.names)))
+    for attr, rtype in cl.unique_attributes():
+        emitter.emit_line('%s%s;' % (emitter.ctype_spaced(rtype),
+                                     emitter.attr(attr)))
+    if cl.has_dict and not cl.is_trait and not cl.builtin_base:
+        # tp_dictoffset and tp_weaklistoffset point at these.
+        emitter.emit_lines('PyObject *__dict__;',
+                           'PyObject *__weakref__;')
+    emitter.emit_line('} %s;' % cl.struct_name(emitter.names))
 
 
 def declare_native_getters_and_setters(cl: ClassIR,
                                        emitter: Emitter) -> None:
+    emit_line = emitter.emit_line
+    names = emitter.names
+    struct_name = cl.struct_name(names)
     for attr, rtype in cl.attributes.items():
-        emitter.emit_line('{}{}({} *self);'.format(emitter.ctype_spaced(rtype),
-                                                   native_getter_name(cl, attr, emitter.names),
-                                                   cl.struct_name(emitter.names)))
-        emitter.emit_line(
-            'bool {}({} *self, {}value);'.format(native_setter_name(cl, attr, emitter.names),
-                                                 cl.struct_name(emitter.names),
-                                                 emitter.ctype_spaced(rtype)))
+        cspaced = emitter.ctype_spaced(rtype)
+        emit_line('%s%s(%s *self);' % (cspaced,
+                                       native_getter_name(cl, attr, names),
+                                       struct_name))
+        emit_line(
+            'bool %s(%s *self, %svalue);' % (native_setter_name(cl, attr, names),
+                                             struct_name,
+                                             cspaced))
 
 
 def generate_native_getters_and_setters(cl: ClassIR,
+                                        struct_name: str,
                                         emitter: Emitter) -> None:
+    emit_line = emitter.emit_line
+    emit_lines = emitter.emit_lines
+    names = emitter.names
     for attr, rtype in cl.attributes.items():
         attr_field = emitter.attr(attr)
+        cspaced = emitter.ctype_spaced(rtype)
+        self_attr = 'self->%s' % attr_field
 
         # Native getter
-        emitter.emit_line('{}{}({} *self)'.format(emitter.ctype_spaced(rtype),
-                                                  native_getter_name(cl, attr, emitter.names),
-                                                  cl.struct_name(emitter.names)))
-        emitter.emit_line('{')
+        emit_line('%s%s(%s *self)' % (cspaced,
+                                      native_getter_name(cl, attr, names),
+                                      struct_name))
+        emit_line('{')
         if rtype.is_refcounted:
-            emit_undefined_check(rtype, emitter, attr_field, '==')
-            emitter.emit_lines(
-                'PyErr_SetString(PyExc_AttributeError, "attribute {} of {} undefined");'.format(
-                    repr(attr), repr(cl.name)),
-                '} else {')
-            emitter.emit_inc_ref('self->{}'.format(attr_field), rtype)
-            emitter.emit_line('}')
-        emitter.emit_line('return self->{};'.format(attr_field))
-        emitter.emit_line('}')
-        emitter.emit_line()
+            # Return early on the error path so that the hot path has a
+            # single unconditional inc_ref and return. (The caller is
+            # responsible for noticing the undefined result either way.)
+            emit_undefined_check(rtype, emitter, attr_field, '==', unlikely=True)
+            emit_lines(
+                'PyErr_SetString(PyExc_AttributeError, "attribute %r of %r undefined");'
+                % (attr, cl.name),
+                'return %s;' % self_attr,
+                '}')
+            emitter.emit_inc_ref(self_attr, rtype)
+        emit_line('return %s;' % self_attr)
+        emit_line('}')
+        emit_line()
         # Native setter
-        emitter.emit_line(
-            'bool {}({} *self, {}value)'.format(native_setter_name(cl, attr, emitter.names),
-                                                cl.struct_name(emitter.names),
-                                                emitter.ctype_spaced(rtype)))
-        emitter.emit_line('{')
+        emit_line(
+            'bool %s(%s *self, %svalue)' % (native_setter_name(cl, attr, names),
+                                            struct_name,
+                                            cspaced))
+        emit_line('{')
         if rtype.is_refcounted:
             emit_undefined_check(rtype, emitter, attr_field, '!=')
-            emitter.emit_dec_ref('self->{}'.format(attr_field), rtype)
-            emitter.emit_line('}')
+            emitter.emit_dec_ref(self_attr, rtype)
+            emit_line('}')
         # This steal the reference to src, so we don't need to increment the arg
-        emitter.emit_lines('self->{} = value;'.format(attr_field),
-                           'return 1;',
-                           '}')
-        emitter.emit_line()
+        emit_lines('%s = value;' % self_attr,
+                   'return 1;',
+                   '}')
+        emit_line()
 
 
 def generate_vtables(base: ClassIR,
@@ -316,43 +540,46 @@ def generate_vtables(base: ClassIR,
     different than the name, if there are trait vtables."""
 
     subtables = []
+    base_prefix = base.name_prefix(emitter.names)
     for trait, vtable in base.trait_vtables.items():
-        name = '{}_{}_trait_vtable'.format(
-            base.name_prefix(emitter.names), trait.name_prefix(emitter.names))
+        name = '%s_%s_trait_vtable' % (
+            base_prefix, trait.name_prefix(emitter.names))
         generate_vtable(vtable, name, emitter, [])
         subtables.append((trait, name))
 
     generate_vtable(base.vtable_entries, vtable_name, emitter, subtables)
 
-    return vtable_name if not subtables else "{} + {}".format(vtable_name, len(subtables) * 2)
+    return vtable_name if not subtables else '%s + %d' % (vtable_name, len(subtables) * 2)
 
 
 def generate_vtable(entries: VTableEntries,
                     vtable_name: str,
                     emitter: Emitter,
                     subtables: List[Tuple[ClassIR, str]]) -> None:
-    emitter.emit_line('static CPyVTableItem {}[] = {{'.format(vtable_name))
+    lines = []  # type: List[str]
     if subtables:
-        emitter.emit_line('/* Array of trait vtables */')
+        lines.append('/* Array of trait vtables */')
         for trait, table in subtables:
             # N.B: C only lets us store constant values. We do a nasty hack of
             # storing a pointer to the location, which we will then dynamically
             # patch up on module load in CPy_FixupTraitVtable.
-            emitter.emit_line('(CPyVTableItem)&{}, (CPyVTableItem){},'.format(
+            lines.append('(CPyVTableItem)&%s, (CPyVTableItem)%s,' % (
                 emitter.type_struct_name(trait), table))
-        emitter.emit_line('/* Start of real vtable */')
+        lines.append('/* Start of real vtable */')
 
+    names = emitter.names
     for entry in entries:
         if isinstance(entry, VTableMethod):
-            emitter.emit_line('(CPyVTableItem){}{},'.format(NATIVE_PREFIX,
-                                                            entry.method.cname(emitter.names)))
+            lines.append('(CPyVTableItem)%s,' % entry.method.native_name(names))
         else:
             cl, attr, is_setter = entry
             namer = native_setter_name if is_setter else native_getter_name
-            emitter.emit_line('(CPyVTableItem){},'.format(namer(cl, attr, emitter.names)))
+            lines.append('(CPyVTableItem)%s,' % namer(cl, attr, names))
     # msvc doesn't allow empty arrays; maybe allowing them at all is an extension?
     if not entries:
-        emitter.emit_line('NULL')
+        lines.append('NULL')
+    emitter.emit_line('static CPyVTableItem %s[] = {' % vtable_name)
+    emitter.emit_raw(lines)
     emitter.emit_line('};')
 
 
@@ -365,41 +592,41 @@ def generate_trait_vtable_setup(cl: ClassIR,
     This needs to be called before a class is used.
     """
     emitter.emit_line('static bool')
-    emitter.emit_line('{}{}(void)'.format(NATIVE_PREFIX, vtable_setup_name))
+    emitter.emit_line('%s%s(void)' % (NATIVE_PREFIX, vtable_setup_name))
     emitter.emit_line('{')
     if cl.trait_vtables and not cl.is_trait:
-        emitter.emit_lines('CPy_FixupTraitVtable({}_vtable, {});'.format(
+        emitter.emit_lines('CPy_FixupTraitVtable(%s_vtable, %d);' % (
             cl.name_prefix(emitter.names), len(cl.trait_vtables)))
     emitter.emit_line('return 1;')
     emitter.emit_line('}')
 
 
-def generate_setup_for_class(cl: ClassIR,
-                             func_name: str,
+def generate_setup_for_class(func_name: str,
                              defaults_fn: Optional[FuncIR],
                              vtable_name: str,
+                             struct_name: str,
+                             type_struct: str,
+                             attrs: List[Tuple[str, RType]],
                              emitter: Emitter) -> None:
     """Generate a native function that allocates an instance of a class."""
     emitter.emit_line('static PyObject *')
-    emitter.emit_line('{}(void)'.format(func_name))
+    emitter.emit_line('%s(void)' % func_name)
     emitter.emit_line('{')
-    emitter.emit_line('{} *self;'.format(cl.struct_name(emitter.names)))
-    emitter.emit_line('self = ({struct} *){type_struct}->tp_alloc({type_struct}, 0);'.format(
-        struct=cl.struct_name(emitter.names),
-        type_struct=emitter.type_struct_name(cl)))
+    emitter.emit_line('%s *self;' % struct_name)
+    emitter.emit_line('self = (%s *)%s->tp_alloc(%s, 0);' % (
+        struct_name, type_struct, type_struct))
     emitter.emit_line('if (self == NULL)')
     emitter.emit_line('    return NULL;')
-    emitter.emit_line('self->vtable = {};'.format(vtable_name))
-    for base in reversed(cl.base_mro):
-        for attr, rtype in base.attributes.items():
-            emitter.emit_line('self->{} = {};'.format(
-                emitter.attr(attr), emitter.c_undefined_value(rtype)))
+    emitter.emit_line('self->vtable = %s;' % vtable_name)
+    emit_line = emitter.emit_line
+    for attr_field, rtype in attrs:
+        emit_line('self->%s = %s;' % (
+            attr_field, emitter.c_undefined_value(rtype)))
 
     # Initialize attributes to default values, if necessary
     if defaults_fn is not None:
         emitter.emit_lines(
-            'if ({}{}((PyObject *)self) == 0) {{'.format(
-                NATIVE_PREFIX, defaults_fn.cname(emitter.names)),
+            'if (%s((PyObject *)self) == 0) {' % defaults_fn.native_name(emitter.names),
             'Py_DECREF(self);',
             'return NULL;',
             '}')
@@ -408,22 +635,21 @@ def generate_setup_for_class(cl: ClassIR,
     emitter.emit_line('}')
 
 
-def generate_constructor_for_class(cl: ClassIR,
-                                   fn: FuncDecl,
+def generate_constructor_for_class(fn: FuncDecl,
+                                   header: str,
                                    init_fn: Optional[FuncIR],
                                    setup_name: str,
-                                   vtable_name: str,
                                    emitter: Emitter) -> None:
     """Generate a native function that allocates and initializes an instance of a class."""
-    emitter.emit_line('{}'.format(native_function_header(fn, emitter)))
+    emitter.emit_line(header)
     emitter.emit_line('{')
-    emitter.emit_line('PyObject *self = {}();'.format(setup_name))
+    emitter.emit_line('PyObject *self = %s();' % setup_name)
     emitter.emit_line('if (self == NULL)')
     emitter.emit_line('    return NULL;')
     if init_fn is not None:
         args = ', '.join(['self'] + [REG_PREFIX + arg.name for arg in fn.sig.args])
-        emitter.emit_line('char res = {}{}({});'.format(
-            NATIVE_PREFIX, init_fn.cname(emitter.names), args))
+        emitter.emit_line('char res = %s(%s);' % (
+            init_fn.native_name(emitter.names), args))
         emitter.emit_line('if (res == 2) {')
         emitter.emit_line('Py_DECREF(self);')
         emitter.emit_line('return NULL;')
@@ -432,91 +658,63 @@ def generate_constructor_for_class(cl: ClassIR,
     emitter.emit_line('}')
 
 
-def generate_init_for_class(cl: ClassIR,
-                            init_fn: FuncIR,
-                            emitter: Emitter) -> str:
-    """Generate an init function suitable for use as tp_init.
-
-    tp_init needs to be a function that returns an int, and our
-    __init__ methods return a PyObject. Translate NULL to -1,
-    everything else to 0.
-    """
-    func_name = '{}_init'.format(cl.name_prefix(emitter.names))
-
-    emitter.emit_line('static int')
-    emitter.emit_line(
-        '{}(PyObject *self, PyObject *args, PyObject *kwds)'.format(func_name))
-    emitter.emit_line('{')
-    emitter.emit_line('return {}{}(self, args, kwds) != NULL ? 0 : -1;'.format(
-        PREFIX, init_fn.cname(emitter.names)))
-    emitter.emit_line('}')
-
-    return func_name
-
-
 def generate_new_for_class(cl: ClassIR,
                            func_name: str,
-                           vtable_name: str,
+                           type_struct: str,
                            setup_name: str,
                            emitter: Emitter) -> None:
     emitter.emit_line('static PyObject *')
     emitter.emit_line(
-        '{}(PyTypeObject *type, PyObject *args, PyObject *kwds)'.format(func_name))
+        '%s(PyTypeObject *type, PyObject *args, PyObject *kwds)' % func_name)
     emitter.emit_line('{')
     # TODO: Check and unbox arguments
-    emitter.emit_line('if (type != {}) {{'.format(emitter.type_struct_name(cl)))
+    emitter.emit_line('if (type != %s) {' % type_struct)
     emitter.emit_line(
         'PyErr_SetString(PyExc_TypeError, "interpreted classes cannot inherit from compiled");')
     emitter.emit_line('return NULL;')
     emitter.emit_line('}')
 
-    emitter.emit_line('return {}();'.format(setup_name))
+    emitter.emit_line('return %s();' % setup_name)
     emitter.emit_line('}')
 
 
-def generate_traverse_for_class(cl: ClassIR,
-                                func_name: str,
+def generate_traverse_for_class(func_name: str,
+                                struct_name: str,
+                                attrs: List[Tuple[str, RType]],
+                                dict_exprs: Optional[Tuple[str, str]],
                                 emitter: Emitter) -> None:
     """Emit function that performs cycle GC traversal of an instance."""
     emitter.emit_line('static int')
-    emitter.emit_line('{}({} *self, visitproc visit, void *arg)'.format(
+    emitter.emit_line('%s(%s *self, visitproc visit, void *arg)' % (
         func_name,
-        cl.struct_name(emitter.names)))
+        struct_name))
     emitter.emit_line('{')
-    for base in reversed(cl.base_mro):
-        for attr, rtype in base.attributes.items():
-            emitter.emit_gc_visit('self->{}'.format(emitter.attr(attr)), rtype)
-    if cl.has_dict:
-        struct_name = cl.struct_name(emitter.names)
-        # __dict__ lives right after the struct and __weakref__ lives right after that
-        emitter.emit_gc_visit('*((PyObject **)((char *)self + sizeof({})))'.format(
-            struct_name), object_rprimitive)
-        emitter.emit_gc_visit(
-            '*((PyObject **)((char *)self + sizeof(PyObject *) + sizeof({})))'.format(
-                struct_name),
-            object_rprimitive)
+    emit_gc_visit = emitter.emit_gc_visit
+    for attr_field, rtype in attrs:
+        emit_gc_visit('self->%s' % attr_field, rtype)
+    if dict_exprs:
+        dict_expr, weakref_expr = dict_exprs
+        emitter.emit_gc_visit(dict_expr, object_rprimitive)
+        emitter.emit_gc_visit(weakref_expr, object_rprimitive)
     emitter.emit_line('return 0;')
     emitter.emit_line('}')
 
 
-def generate_clear_for_class(cl: ClassIR,
-                             func_name: str,
+def generate_clear_for_class(func_name: str,
+                             struct_name: str,
+                             attrs: List[Tuple[str, RType]],
+                             dict_exprs: Optional[Tuple[str, str]],
                              emitter: Emitter) -> None:
     emitter.emit_line('static int')
-    emitter.emit_line('{}({} *self)'.format(func_name, cl.struct_name(emitter.names)))
+    emitter.emit_line('%s(%s *self)' % (func_name, struct_name))
     emitter.emit_line('{')
-    for base in reversed(cl.base_mro):
-        for attr, rtype in base.attributes.items():
-            emitter.emit_gc_clear('self->{}'.format(emitter.attr(attr)), rtype)
-    if cl.has_dict:
-        struct_name = cl.struct_name(emitter.names)
-        # __dict__ lives right after the struct and __weakref__ lives right after that
-        emitter.emit_gc_clear('*((PyObject **)((char *)self + sizeof({})))'.format(
-            struct_name), object_rprimitive)
-        emitter.emit_gc_clear(
-            '*((PyObject **)((char *)self + sizeof(PyObject *) + sizeof({})))'.format(
-                struct_name),
-            object_rprimitive)
+    emit_gc_clear = emitter.emit_gc_clear
+    for attr_field, rtype in attrs:
+        emit_gc_clear('self->%s' % attr_field, rtype)
+    if dict_exprs:
+        dict_expr, weakref_expr = dict_exprs
+        emitter.emit_gc_clear(dict_expr, object_rprimitive)
+        emitter.emit_gc_clear(weakref_expr, object_rprimitive)
     emitter.emit_line('return 0;')
     emitter.emit_line('}')
 
@@ -524,12 +722,13 @@ def generate_clear_for_class(cl: ClassIR,
 def generate_dealloc_for_class(cl: ClassIR,
                                dealloc_func_name: str,
                                clear_func_name: str,
+                               struct_name: str,
                                emitter: Emitter) -> None:
     emitter.emit_line('static void')
-    emitter.emit_line('{}({} *self)'.format(dealloc_func_name, cl.struct_name(emitter.names)))
+    emitter.emit_line('%s(%s *self)' % (dealloc_func_name, struct_name))
     emitter.emit_line('{')
     emitter.emit_line('PyObject_GC_UnTrack(self);')
-    emitter.emit_line('{}(self);'.format(clear_func_name))
+    emitter.emit_line('%s(self);' % clear_func_name)
     emitter.emit_line('Py_TYPE(self)->tp_free((PyObject *)self);')
     emitter.emit_line('}')
 
@@ -537,154 +736,183 @@ def generate_dealloc_for_class(cl: ClassIR,
 def generate_methods_table(cl: ClassIR,
                            name: str,
                            emitter: Emitter) -> None:
-    emitter.emit_line('static PyMethodDef {}[] = {{'.format(name))
+    names = emitter.names
+    lines = []  # type: List[str]
     for fn in cl.methods.values():
         if fn.decl.is_prop_setter or fn.decl.is_prop_getter:
             continue
-        emitter.emit_line('{{"{}",'.format(fn.name))
-        emitter.emit_line(' (PyCFunction){}{},'.format(PREFIX, fn.cname(emitter.names)))
+        lines.append('{"%s",' % fn.name)
+        lines.append(' (PyCFunction)%s%s,' % (PREFIX, fn.cname(names)))
         flags = ['METH_VARARGS', 'METH_KEYWORDS']
         if fn.decl.kind == FUNC_STATICMETHOD:
             flags.append('METH_STATIC')
         elif fn.decl.kind == FUNC_CLASSMETHOD:
             flags.append('METH_CLASS')
 
-        emitter.emit_line(' {}, NULL}},'.format(' | '.join(flags)))
-    emitter.emit_line('{NULL}  /* Sentinel */')
+        lines.append(' %s, NULL},' % ' | '.join(flags))
+    lines.append('{NULL}  /* Sentinel */')
+    emitter.emit_line('static PyMethodDef %s[] = {' % name)
+    emitter.emit_raw(lines)
     emitter.emit_line('};')
 
 
 def generate_side_table_for_class(cl: ClassIR,
                                   name: str,
-                                  type: str,
+                                  table_type: str,
                                   slots: Dict[str, str],
                                   emitter: Emitter) -> Optional[str]:
-    name = '{}_{}'.format(cl.name_prefix(emitter.names), name)
-    emitter.emit_line('static {} {} = {{'.format(type, name))
-    for field, value in slots.items():
-        emitter.emit_line(".{} = {},".format(field, value))
+    name = '%s_%s' % (cl.name_prefix(emitter.names), name)
+    emitter.emit_line('static %s %s = {' % (table_type, name))
+    emitter.emit_raw(['.%s = %s,' % (field, value) for field, value in slots.items()])
     emitter.emit_line("};")
     return name
 
 
 def generate_getseter_declarations(cl: ClassIR, emitter: Emitter) -> None:
+    emit_line = emitter.emit_line
+    names = emitter.names
+    struct_name = cl.struct_name(names)
     if not cl.is_trait:
-        for attr in cl.attributes:
-            emitter.emit_line('static PyObject *')
-            emitter.emit_line('{}({} *self, void *closure);'.format(
-                getter_name(cl, attr, emitter.names),
-                cl.struct_name(emitter.names)))
-            emitter.emit_line('static int')
-            emitter.emit_line('{}({} *self, PyObject *value, void *closure);'.format(
-                setter_name(cl, attr, emitter.names),
-                cl.struct_name(emitter.names)))
+        for attr, rtype in cl.attributes.items():
+            if attr_uses_member_descriptor(cl, rtype):
+                continue
+            emit_line('static PyObject *')
+            emit_line('%s(%s *self, void *closure);' % (
+                getter_name(cl, attr, names),
+                struct_name))
+            emit_line('static int')
+            emit_line('%s(%s *self, PyObject *value, void *closure);' % (
+                setter_name(cl, attr, names),
+                struct_name))
 
     for prop in cl.properties:
         # Generate getter declaration
-        emitter.emit_line('static PyObject *')
-        emitter.emit_line('{}({} *self, void *closure);'.format(
-            getter_name(cl, prop, emitter.names),
-            cl.struct_name(emitter.names)))
+        emit_line('static PyObject *')
+        emit_line('%s(%s *self, void *closure);' % (
+            getter_name(cl, prop, names),
+            struct_name))
 
         # Generate property setter declaration if a setter exists
         if cl.properties[prop][1]:
-            emitter.emit_line('static int')
-            emitter.emit_line('{}({} *self, PyObject *value, void *closure);'.format(
-                setter_name(cl, prop, emitter.names),
-                cl.struct_name(emitter.names)))
+            emit_line('static int')
+            emit_line('%s(%s *self, PyObject *value, void *closure);' % (
+                setter_name(cl, prop, names),
+                struct_name))
 
 
 def generate_getseters_table(cl: ClassIR,
                              name: str,
                              emitter: Emitter) -> None:
-    emitter.emit_line('static PyGetSetDef {}[] = {{'.format(name))
+    names = emitter.names
+    lines = []  # type: List[str]
     if not cl.is_trait:
-        for attr in cl.attributes:
-            emitter.emit_line('{{"{}",'.format(attr))
-            emitter.emit_line(' (getter){}, (setter){},'.format(
-                getter_name(cl, attr, emitter.names), setter_name(cl, attr, emitter.names)))
-            emitter.emit_line(' NULL, NULL},')
+        for attr, rtype in cl.attributes.items():
+            if attr_uses_member_descriptor(cl, rtype):
+                continue
+            lines.append('{"%s",' % attr)
+            lines.append(' (getter)%s, (setter)%s,' % (
+                getter_name(cl, attr, names), setter_name(cl, attr, names)))
+            lines.append(' NULL, NULL},')
     for prop in cl.properties:
-        emitter.emit_line('{{"{}",'.format(prop))
-        emitter.emit_line(' (getter){},'.format(getter_name(cl, prop, emitter.names)))
+        lines.append('{"%s",' % prop)
+        lines.append(' (getter)%s,' % getter_name(cl, prop, names))
 
         setter = cl.properties[prop][1]
         if setter:
-            emitter.emit_line(' (setter){},'.format(setter_name(cl, prop, emitter.names)))
-            emitter.emit_line('NULL, NULL},')
+            lines.append(' (setter)%s,' % setter_name(cl, prop, names))
+            lines.append('NULL, NULL},')
         else:
-            emitter.emit_line('NULL, NULL, NULL},')
+            lines.append('NULL, NULL, NULL},')
 
-    emitter.emit_line('{NULL}  /* Sentinel */')
+    lines.append('{NULL}  /* Sentinel */')
+    emitter.emit_line('static PyGetSetDef %s[] = {' % name)
+    emitter.emit_raw(lines)
     emitter.emit_line('};')
 
 
 def generate_getseters(cl: ClassIR, emitter: Emitter) -> None:
+    struct_name = cl.struct_name(emitter.names)
     if not cl.is_trait:
-        for i, (attr, rtype) in enumerate(cl.attributes.items()):
-            generate_getter(cl, attr, rtype, emitter)
-            emitter.emit_line('')
-            generate_setter(cl, attr, rtype, emitter)
-            if i < len(cl.attributes) - 1:
+        getset_attrs = [(attr, rtype) for attr, rtype in cl.attributes.items()
+                        if not attr_uses_member_descriptor(cl, rtype)]
+        for i, (attr, rtype) in enumerate(getset_attrs):
+            if i != 0:
                 emitter.emit_line('')
+            generate_getter(cl, attr, rtype, struct_name, emitter)
+            emitter.emit_line('')
+            generate_setter(cl, attr, rtype, struct_name, emitter)
     for prop, (getter, setter) in cl.properties.items():
         rtype = getter.sig.ret_type
         emitter.emit_line('')
-        generate_readonly_getter(cl, prop, rtype, getter, emitter)
+        generate_readonly_getter(cl, prop, rtype, getter, struct_name, emitter)
         if setter:
             arg_type = setter.sig.args[1].type
             emitter.emit_line('')
-            generate_property_setter(cl, prop, arg_type, setter, emitter)
+            generate_property_setter(cl, prop, arg_type, setter, struct_name, emitter)
 
 
 def generate_getter(cl: ClassIR,
                     attr: str,
                     rtype: RType,
+                    struct_name: str,
                     emitter: Emitter) -> None:
     attr_field = emitter.attr(attr)
-    emitter.emit_line('static PyObject *')
-    emitter.emit_line('{}({} *self, void *closure)'.format(getter_name(cl, attr, emitter.names),
-                                                           cl.struct_name(emitter.names)))
+    self_attr = 'self->%s' % attr_field
+    emitter.emit_line('CPy_HOT static PyObject *')
+    emitter.emit_line('%s(%s *self, void *closure)' % (getter_name(cl, attr, emitter.names),
+                                                       struct_name))
     emitter.emit_line('{')
-    emit_undefined_check(rtype, emitter, attr_field, '==')
+    if not rtype.is_unboxed:
+        # Load the field once and INCREF before the undefined check:
+        # Py_XINCREF tolerates NULL, so the increment doesn't have to
+        # wait for the branch on the common defined path.
+        emitter.emit_lines('PyObject *value = %s;' % self_attr,
+                           'Py_XINCREF(value);',
+                           'if (unlikely(value == NULL)) {')
+    else:
+        emit_undefined_check(rtype, emitter, attr_field, '==', unlikely=True)
     emitter.emit_line('PyErr_SetString(PyExc_AttributeError,')
-    emitter.emit_line('    "attribute {} of {} undefined");'.format(repr(attr),
-                                                                    repr(cl.name)))
+    emitter.emit_line('    "attribute %r of %r undefined");' % (attr, cl.name))
     emitter.emit_line('return NULL;')
     emitter.emit_line('}')
-    emitter.emit_inc_ref('self->{}'.format(attr_field), rtype)
-    emitter.emit_box('self->{}'.format(attr_field), 'retval', rtype, declare_dest=True)
-    emitter.emit_line('return retval;')
+    if not rtype.is_unboxed:
+        emitter.emit_line('return value;')
+    else:
+        emitter.emit_inc_ref(self_attr, rtype)
+        emitter.emit_box(self_attr, 'retval', rtype, declare_dest=True)
+        emitter.emit_line('return retval;')
     emitter.emit_line('}')
 
 
 def generate_setter(cl: ClassIR,
                     attr: str,
                     rtype: RType,
+                    struct_name: str,
                     emitter: Emitter) -> None:
     attr_field = emitter.attr(attr)
-    emitter.emit_line('static int')
-    emitter.emit_line('{}({} *self, PyObject *value, void *closure)'.format(
+    self_attr = 'self->%s' % attr_field
+    emitter.emit_line('CPy_HOT static int')
+    emitter.emit_line('%s(%s *self, PyObject *value, void *closure)' % (
         setter_name(cl, attr, emitter.names),
-        cl.struct_name(emitter.names)))
+        struct_name))
     emitter.emit_line('{')
     if rtype.is_refcounted:
         emit_undefined_check(rtype, emitter, attr_field, '!=')
-        emitter.emit_dec_ref('self->{}'.format(attr_field), rtype)
+        emitter.emit_dec_ref(self_attr, rtype)
         emitter.emit_line('}')
     emitter.emit_line('if (value != NULL) {')
     if rtype.is_unboxed:
-        emitter.emit_unbox('value', 'tmp', rtype, custom_failure='return -1;', declare_dest=True)
+        emit_unbox_with_setter_failure(emitter, rtype)
     elif is_same_type(rtype, object_rprimitive):
         emitter.emit_line('PyObject *tmp = value;')
     else:
         emitter.emit_cast('value', 'tmp', rtype, declare_dest=True)
-        emitter.emit_lines('if (!tmp)',
+        emitter.emit_lines('if (unlikely(!tmp))',
                            '    return -1;')
     emitter.emit_inc_ref('tmp', rtype)
-    emitter.emit_line('self->{} = tmp;'.format(attr_field))
+    emitter.emit_line('%s = tmp;' % self_attr)
     emitter.emit_line('} else')
-    emitter.emit_line('    self->{} = {};'.format(attr_field, emitter.c_undefined_value(rtype)))
+    emitter.emit_line('    %s = %s;' % (self_attr, emitter.c_undefined_value(rtype)))
     emitter.emit_line('return 0;')
     emitter.emit_line('}')
 
@@ -693,54 +921,81 @@ def generate_readonly_getter(cl: ClassIR,
                              attr: str,
                              rtype: RType,
                              func_ir: FuncIR,
+                             struct_name: str,
                              emitter: Emitter) -> None:
-    emitter.emit_line('static PyObject *')
-    emitter.emit_line('{}({} *self, void *closure)'.format(getter_name(cl, attr, emitter.names),
-                                                           cl.struct_name(emitter.names)))
-    emitter.emit_line('{')
+    names = emitter.names
+    native_call = '%s((PyObject *) self)' % func_ir.native_name(names)
+    emitter.emit_lines(
+        'CPy_HOT static PyObject *',
+        '%s(%s *self, void *closure)' % (getter_name(cl, attr, names),
+                                         struct_name),
+        '{')
     if rtype.is_unboxed:
-        emitter.emit_line('{}retval = {}{}((PyObject *) self);'.format(
-            emitter.ctype_spaced(rtype), NATIVE_PREFIX, func_ir.cname(emitter.names)))
+        emitter.emit_line('%sretval = %s;' % (emitter.ctype_spaced(rtype), native_call))
         emitter.emit_box('retval', 'retbox', rtype, declare_dest=True)
-        emitter.emit_line('return retbox;')
+        emitter.emit_lines('return retbox;',
+                           '}')
     else:
-        emitter.emit_line('return {}{}((PyObject *) self);'.format(NATIVE_PREFIX,
-                                                                   func_ir.cname(emitter.names)))
-    emitter.emit_line('}')
+        emitter.emit_lines('return %s;' % native_call,
+                           '}')
 
 
 def generate_property_setter(cl: ClassIR,
                              attr: str,
                              arg_type: RType,
                              func_ir: FuncIR,
+                             struct_name: str,
                              emitter: Emitter) -> None:
 
-    emitter.emit_line('static int')
-    emitter.emit_line('{}({} *self, PyObject *value, void *closure)'.format(
-        setter_name(cl, attr, emitter.names),
-        cl.struct_name(emitter.names)))
-    emitter.emit_line('{')
+    names = emitter.names
+    native = func_ir.native_name(names)
+    emitter.emit_lines(
+        'CPy_HOT static int',
+        '%s(%s *self, PyObject *value, void *closure)' % (
+            setter_name(cl, attr, names),
+            struct_name),
+        '{')
     if arg_type.is_unboxed:
-        emitter.emit_unbox('value', 'tmp', arg_type, custom_failure='return -1;',
+        # For tagged ints this compiles to a PyLong_Check plus a call
+        # to CPyTagged_FromObject, whose short-int fast path is a
+        # header static that the C compiler inlines here.
+        emit_unbox_with_setter_failure(emitter, arg_type)
+        emitter.emit_lines('%s((PyObject *) self, tmp);' % native,
+                           'return 0;',
+                           '}')
+    else:
+        emitter.emit_lines('%s((PyObject *) self, value);' % native,
+                           'return 0;',
+                           '}')
+
+
+def emit_unbox_with_setter_failure(emitter: Emitter, rtype: RType) -> None:
+    """Unbox 'value' into 'tmp', failing through the shared setter error path.
+
+    CPySetterTypeError raises and returns -1 in one call, so the error
+    block isn't repeated in every generated setter. Tuples keep the
+    inline raise: their nested item unboxes report the mismatched item
+    type, which the shared helper can't know.
+    """
+    if isinstance(rtype, RTuple):
+        emitter.emit_unbox('value', 'tmp', rtype, custom_failure='return -1;',
                            declare_dest=True)
-        emitter.emit_line('{}{}((PyObject *) self, tmp);'.format(
-                          NATIVE_PREFIX,
-                          func_ir.cname(emitter.names)))
     else:
-        emitter.emit_line('{}{}((PyObject *) self, value);'.format(
-                          NATIVE_PREFIX,
-                          func_ir.cname(emitter.names)))
-    emitter.emit_line('return 0;')
-    emitter.emit_line('}')
+        emitter.emit_unbox(
+            'value', 'tmp', rtype,
+            custom_failure='return CPySetterTypeError("%s", value);'
+                           % emitter.pretty_name(rtype),
+            declare_dest=True, raise_exception=False)
 
 
-def emit_undefined_check(rtype: RType, emitter: Emitter, attr: str, compare: str) -> None:
+def emit_undefined_check(rtype: RType, emitter: Emitter, attr: str, compare: str,
+                         unlikely: bool = False) -> None:
+    attr_expr = 'self->%s' % attr
     if isinstance(rtype, RTuple):
-        attr_expr = 'self->{}'.format(attr)
-        emitter.emit_line(
-            'if ({}) {{'.format(
-                emitter.tuple_undefined_check_cond(
-                    rtype, attr_expr, emitter.c_undefined_value, compare)))
+        check = emitter.tuple_undefined_check_cond(
+            rtype, attr_expr, emitter.c_undefined_value, compare)
     else:
-        emitter.emit_line(
-            'if (self->{} {} {}) {{'.format(attr, compare, emitter.c_undefined_value(rtype)))
+        check = '%s %s %s' % (attr_expr, compare, emitter.c_undefined_value(rtype))
+    if unlikely:
+        check = 'unlikely(%s)' % check
+    emitter.emit_line('if (%s) {' % check)
@@ -147,9 +147,14 @@ class ModuleGenerator:
             # Finals must be last (types can depend on declared above)
             self.define_finals(module.final_names, emitter)
 
+            # Each class is emitted into its own fragment list and the
+            # lists are concatenated in definition order, so the classes
+            # don't depend on each other's emission state.
             for cl in module.classes:
                 if cl.is_ext_class:
-                    generate_class(cl, module_name, emitter)
+                    class_emitter = Emitter(self.context)
+                    generate_class(cl, module_name, class_emitter)
+                    emitter.fragments.extend(class_emitter.fragments)
 
             # Generate Python extension module definitions and module initialization functions.
             self.generate_module_def(emitter, module_name, module)
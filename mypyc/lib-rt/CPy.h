@@ -39,6 +39,22 @@ static void CPy_XDecRef(PyObject *p) {
 // Ssize_t: A Py_ssize_t, which ought to be the same width as pointers
 // Object: CPython object (PyObject *)
 
+// The shared skeleton of the static PyTypeObject templates emitted
+// for native classes. The varying slots follow the HEAD macro as
+// designated initializers; END closes the struct and defines the
+// template pointer that CPyType_FromTemplate() is handed at module
+// init time. Factoring the common part out keeps the generated C
+// smaller.
+#define CPy_TYPE_TEMPLATE_HEAD(type_struct, pyname, flags) \
+    static PyTypeObject type_struct##_template_ = {        \
+        PyVarObject_HEAD_INIT(NULL, 0)                     \
+        .tp_name = pyname,                                 \
+        .tp_flags = flags,
+
+#define CPy_TYPE_TEMPLATE_END(type_struct) \
+    };                                     \
+    static PyTypeObject *type_struct##_template = &type_struct##_template_;
+
 static void CPyDebug_Print(const char *msg) {
     printf("%s\n", msg);
     fflush(stdout);
@@ -1077,6 +1093,14 @@ static void CPy_TypeError(const char *expected, PyObject *value) {
     }
 }
 
+// Raise a type error for a rejected attribute assignment and return
+// the setter error value, so generated setters can share one error
+// path instead of inlining it per attribute.
+static int CPySetterTypeError(const char *expected, PyObject *value) {
+    CPy_TypeError(expected, value);
+    return -1;
+}
+
 // These functions are basically exactly PyCode_NewEmpty and
 // _PyTraceback_Add which are available in all the versions we support.
 // We're continuing to use them because we'll probably optimize them later.
@@ -23,6 +23,15 @@
 #define CPy_NOINLINE
 #endif
 
+// Hint that a function is called frequently. GCC and Clang optimize
+// such functions more aggressively and group them together in the
+// text segment for better locality.
+#if defined(__clang__) || defined(__GNUC__)
+#define CPy_HOT __attribute__((hot))
+#else
+#define CPy_HOT
+#endif
+
 // INCREF and DECREF that assert the pointer is not NULL.
 // asserts are disabled in release builds so there shouldn't be a perf hit.
 // I'm honestly kind of surprised that this isn't done by default.
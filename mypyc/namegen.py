@@ -48,7 +48,7 @@ class NameGenerator:
         """
         module_names = module_names or []
         self.module_map = make_module_translation_map(module_names)
-        self.translations = {}  # type: Dict[Tuple[str, str], str]
+        self.translations = {}  # type: Dict[Tuple[str, Optional[str]], str]
         self.used_names = set()  # type: Set[str]
 
     def private_name(self, module: str, partial_name: Optional[str] = None) -> str:
@@ -65,20 +65,24 @@ class NameGenerator:
         be an empty string.
         """
         # TODO: Support unicode
+        # The same names get requested over and over during a build, so
+        # cache every result (including the module-only form).
+        cached = self.translations.get((module, partial_name))
+        if cached is not None:
+            return cached
         if partial_name is None:
-            return self.module_map[module].rstrip('_')
-        if (module, partial_name) in self.translations:
-            return self.translations[module, partial_name]
-        if module in self.module_map:
-            module_prefix = self.module_map[module]
-        elif module:
-            module_prefix = module.replace('.', '_') + '_'
+            actual = self.module_map[module].rstrip('_')
         else:
-            module_prefix = ''
-        candidate = '{}{}'.format(module_prefix, partial_name.replace('.', '_'))
-        actual = self.make_unique(candidate)
+            if module in self.module_map:
+                module_prefix = self.module_map[module]
+            elif module:
+                module_prefix = module.replace('.', '_') + '_'
+            else:
+                module_prefix = ''
+            candidate = '{}{}'.format(module_prefix, partial_name.replace('.', '_'))
+            actual = self.make_unique(candidate)
+            self.used_names.add(actual)
         self.translations[module, partial_name] = actual
-        self.used_names.add(actual)
         return actual
 
     def make_unique(self, name: str) -> str:
@@ -22,6 +22,7 @@ from mypy.nodes import ARG_NAMED_OPT, ARG_OPT, ARG_POS, Block, FuncDef, SymbolNo
 
 from mypy_extensions import trait
 
+from mypyc.common import NATIVE_PREFIX
 from mypyc.namegen import NameGenerator
 
 MYPY = False
@@ -249,6 +250,9 @@ class RTuple(RType):
         # Nominally the max c length is 31 chars, but I'm not honestly worried about this.
         self.struct_name = 'tuple_{}'.format(self.unique_id)
         self._ctype = 'struct {}'.format(self.struct_name)
+        # Name of the C global holding the undefined value sentinel for
+        # this type (the emitter declares it on first use).
+        self.undefined_name = 'tuple_undefined_{}'.format(self.unique_id)
 
     def accept(self, visitor: 'RTypeVisitor[T]') -> T:
         return visitor.visit_rtuple(self)
@@ -1407,6 +1411,8 @@ class FuncDecl:
         self.kind = kind
         self.is_prop_setter = False
         self.is_prop_getter = False
+        self._cname_cache = {}  # type: Dict[int, str]
+        self._native_name_cache = {}  # type: Dict[int, str]
         if class_name is None:
             self.bound_sig = None  # type: Optional[FuncSignature]
         else:
@@ -1416,10 +1422,27 @@ class FuncDecl:
                 self.bound_sig = FuncSignature(sig.args[1:], sig.ret_type)
 
     def cname(self, names: NameGenerator) -> str:
-        name = self.name
-        if self.class_name:
-            name += '_' + self.class_name
-        return names.private_name(self.module_name, name)
+        # The same declaration gets named over and over while emitting
+        # vtables, method tables and wrappers, so cache the result per
+        # name generator.
+        key = id(names)
+        cached = self._cname_cache.get(key)
+        if cached is None:
+            name = self.name
+            if self.class_name:
+                name += '_' + self.class_name
+            cached = names.private_name(self.module_name, name)
+            self._cname_cache[key] = cached
+        return cached
+
+    def native_name(self, names: NameGenerator) -> str:
+        """Return the C name of the native (non-wrapper) function."""
+        key = id(names)
+        cached = self._native_name_cache.get(key)
+        if cached is None:
+            cached = NATIVE_PREFIX + self.cname(names)
+            self._native_name_cache[key] = cached
+        return cached
 
 
 class FuncIR:
@@ -1463,6 +1486,9 @@ class FuncIR:
     def cname(self, names: NameGenerator) -> str:
         return self.decl.cname(names)
 
+    def native_name(self, names: NameGenerator) -> str:
+        return self.decl.native_name(names)
+
     def __str__(self) -> str:
         return '\n'.join(format_func(self))
 
@@ -1591,6 +1617,9 @@ class ClassIR:
         # in a few ad-hoc cases.
         self.builtin_base = None  # type: Optional[str]
 
+        # Cache of unique_attributes(), computed lazily during code generation.
+        self._unique_attributes = None  # type: Optional[Tuple[Tuple[str, RType], ...]]
+
     @property
     def fullname(self) -> str:
         return "{}.{}".format(self.module_name, self.name)
@@ -1651,6 +1680,27 @@ class ClassIR:
             return False
         return True
 
+    def unique_attributes(self) -> Tuple[Tuple[str, RType], ...]:
+        """Return (name, type) pairs for the attributes stored in instances.
+
+        This walks the concrete MRO in reverse, dropping duplicates, and
+        so matches the layout of the object struct. The result is an
+        immutable tuple cached on the first call, so the reversed
+        iterator and dict views are only allocated once per class; it
+        must not be called before the class IR is complete.
+        """
+        if self._unique_attributes is None:
+            attrs = []  # type: List[Tuple[str, RType]]
+            seen = set()  # type: Set[Tuple[str, RType]]
+            for base in reversed(self.base_mro):
+                if not base.is_trait:
+                    for item in base.attributes.items():
+                        if item not in seen:
+                            attrs.append(item)
+                            seen.add(item)
+            self._unique_attributes = tuple(attrs)
+        return self._unique_attributes
+
     def name_prefix(self, names: NameGenerator) -> str:
         return names.private_name(self.module_name, self.name)
 
@@ -28,3 +28,9 @@ class TestEmitter(unittest.TestCase):
                                           'a {\n',
                                           '    f();\n',
                                           '}\n']
+
+    def test_emit_raw(self) -> None:
+        self.emitter.emit_line('a {')
+        self.emitter.emit_raw(['x;', 'y;'])
+        self.emitter.emit_line('}')
+        assert ''.join(self.emitter.fragments) == 'a {\n    x;\n    y;\n}\n'